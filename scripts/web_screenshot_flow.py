@@ -8,46 +8,248 @@ Spec format (JSON):
   "fullPage": true,
   "timeoutMs": 30000,
   "headless": true,
+  "waitUntil": "domcontentloaded",
   "steps": [
     {"action": "waitFor", "selector": "text=LOGIN"},
     {"action": "screenshot", "path": "01-landing.jpg", "quality": 90},
-    {"action": "click", "selector": "text=LOGIN"},
-    {"action": "screenshot", "path": "02-after-login-click.jpg", "afterMs": 100, "quality": 90},
+    {"action": "click", "selector": "text=LOGIN", "afterWait": {"selector": "text=Continue with Google"}},
+    {"action": "screenshot", "path": "02-after-login-click.jpg", "quality": 90},
     {"action": "clickText", "text": "Continue with Google"},
     {"action": "screenshot", "path": "03-after-google-click.jpg", "afterMs": 100, "quality": 90}
   ]
 }
 
 Notes:
+- "waitUntil" (load|domcontentloaded|networkidle|commit) defaults to
+  "domcontentloaded"; many SPAs never reach "networkidle", so rely on "waitFor" or
+  "afterWait" for readiness. A "goto" step may set its own "waitUntil".
 - Save repo screenshots under screenshots/<flow>/ (not .logs/).
 - Use .jpg with quality 90 for consistent size.
+- Spec-level "format" ("png" or "jpeg") applies to every screenshot without its own
+  "type" and rewrites the file extension to match (01-landing.png -> 01-landing.jpg).
+  JPEG encodes much faster than PNG for tall full-page captures. Spec-level "quality"
+  (default 85) applies to JPEG screenshots without their own "quality". Playwright
+  cannot produce WebP screenshots.
 - For reusable flows, keep the spec under screenshots/<flow>/flow.json.
+- Specs are parsed with orjson when it is installed (pip install orjson), falling back
+  to the stdlib json module otherwise.
+- Prefer "afterWait" over fixed delays. It accepts {"selector": ..., "state": ...}
+  (state defaults to "visible"), {"function": "<js predicate>"}, or
+  {"loadState": "load|domcontentloaded|networkidle"}.
+- "clickText" clicks the first element, in document order, that is a button or link
+  whose accessible name contains "text" (case-insensitive), or whose full text equals
+  "text" exactly. Use "click" with a selector when several elements match.
+- "afterMs" is deprecated: it always sleeps for the full duration. It is only used
+  when a step has no "afterWait".
+- Pass --spec multiple times to run several flows in one browser; each flow gets
+  its own browser context and --parallel N controls how many run at once.
+- To skip the Chromium launch on every run, start a long-lived browser with
+  --server /tmp/spark-webflow.sock and run specs with --client /tmp/spark-webflow.sock.
+  Each client request still gets a fresh browser context.
+- Set "storageStatePath" to reuse cookies/localStorage between runs: the context is
+  restored from that file when it exists and saved back when the flow succeeds.
+  Use {"action": "saveStorage"} to checkpoint mid-flow (optionally with its own
+  "path"). Relative paths resolve against the spec directory. The file holds
+  session credentials, so keep it outside the repo (e.g. under /tmp or data/).
+- Use "viewports": [{"width": 1440, "height": 900}, {"width": 390, "height": 844}]
+  instead of "viewport" to run the same steps at several sizes concurrently in one
+  browser. Screenshot names then get a size suffix, e.g. 01-landing@1440x900.jpg.
+- "blockResources" aborts requests by Playwright resource type (e.g. ["image", "font",
+  "media"]); the extra "analytics" entry blocks common tracker domains. "blockUrls"
+  takes URL globs matched against the full URL: "**" matches anything, "*" matches
+  anything except "/", and every other character is literal, including "?" (so query
+  strings match as written). "{a,b}" groups are not supported; list each URL instead.
+  Blocking speeds up screenshot-only flows, but blocked images/fonts will be missing
+  from captures.
 """
 
 from __future__ import annotations
 
 import argparse
+import asyncio
+import io
 import json
+import logging
+import logging.handlers
+import os
+import queue
+import re
+import socket
+import stat
 import sys
+import tempfile
+import urllib.parse
+from collections.abc import Callable
+from dataclasses import dataclass, field
 from pathlib import Path
-from typing import Any
+from typing import Any, TextIO
 
-from playwright.sync_api import TimeoutError as PlaywrightTimeoutError
-from playwright.sync_api import sync_playwright
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+from playwright.async_api import Browser, BrowserContext, Locator, Page, Route
+from playwright.async_api import TimeoutError as PlaywrightTimeoutError
+from playwright.async_api import async_playwright
+
+
+logger = logging.getLogger("web_screenshot_flow")
 
 
 class SpecError(ValueError):
     pass
 
 
+IMAGE_SUFFIXES = {"png": ".png", "jpeg": ".jpg"}
+
+WAIT_UNTIL_STATES = ("load", "domcontentloaded", "networkidle", "commit")
+
+RESOURCE_TYPES = frozenset(
+    {
+        "document",
+        "stylesheet",
+        "image",
+        "media",
+        "font",
+        "script",
+        "texttrack",
+        "xhr",
+        "fetch",
+        "eventsource",
+        "websocket",
+        "manifest",
+        "other",
+    }
+)
+
+ANALYTICS_URL_GLOBS = (
+    "**/*google-analytics.com/**",
+    "**/*googletagmanager.com/**",
+    "**/*doubleclick.net/**",
+    "**/*segment.io/**",
+    "**/*segment.com/**",
+    "**/*mixpanel.com/**",
+    "**/*hotjar.com/**",
+    "**/*clarity.ms/**",
+    "**/*facebook.net/**",
+    "**/*vercel-insights.com/**",
+)
+
+
+LocatorGetter = Callable[[Page], Locator]
+
+
+@dataclass
+class FlowConfig:
+    spec_path: Path
+    url: str
+    steps: list[Step]
+    viewports: list[tuple[int, int]]
+    viewport_suffix: bool
+    timeout_ms: int
+    full_page: bool
+    headless: bool
+    wait_until: str
+    slow_mo: int | None
+    base_dir: Path
+    storage_state_path: Path | None = None
+    blocked_resource_types: frozenset[str] = frozenset()
+    blocked_url_pattern: re.Pattern[str] | None = None
+    log: logging.Logger = field(default_factory=lambda: logger)
+    # Shared by every flow in a run so concurrent saves to one storage state file serialize.
+    storage_locks: dict[Path, asyncio.Lock] = field(default_factory=dict)
+
+
+class ScreenshotWriter:
+    """Writes captured screenshot bytes in the background so the flow can move on."""
+
+    def __init__(self, log: logging.Logger) -> None:
+        self.log = log
+        self.failures = 0
+        self.queue: asyncio.Queue[tuple[Path, bytes]] = asyncio.Queue()
+        self.task: asyncio.Task[None] | None = None
+
+    def start(self) -> None:
+        self.task = asyncio.create_task(self._writer())
+
+    def put(self, path: Path, data: bytes) -> None:
+        self.queue.put_nowait((path, data))
+
+    async def _writer(self) -> None:
+        while True:
+            path, data = await self.queue.get()
+            try:
+                await asyncio.to_thread(path.write_bytes, data)
+            except OSError as exc:
+                self.failures += 1
+                self.log.error("error: failed to write %s: %s", path, exc)
+            else:
+                self.log.info("Saved screenshot: %s", path)
+            finally:
+                self.queue.task_done()
+
+    async def close(self) -> None:
+        if self.task is None:
+            return
+        await self.queue.join()
+        self.task.cancel()
+        self.task = None
+
+
+@dataclass
+class StepContext:
+    flow: FlowConfig
+    writer: ScreenshotWriter
+    viewport_suffix: str = ""
+
+    def screenshot_path(self, path: str) -> Path:
+        out_path = resolve_path(path, self.flow.base_dir)
+        if self.viewport_suffix:
+            out_path = out_path.with_name(f"{out_path.stem}{self.viewport_suffix}{out_path.suffix}")
+        return out_path
+
+
+def stream_handlers(stdout: TextIO, stderr: TextIO) -> list[logging.Handler]:
+    # Progress goes to stdout and errors to stderr, matching the script's plain-print output.
+    out_handler = logging.StreamHandler(stdout)
+    out_handler.addFilter(lambda record: record.levelno < logging.WARNING)
+    err_handler = logging.StreamHandler(stderr)
+    err_handler.setLevel(logging.WARNING)
+    return [out_handler, err_handler]
+
+
+def start_log_listener() -> logging.handlers.QueueListener:
+    """Route log records through a queue so steps never block on stdout/stderr flushes."""
+    log_queue: queue.Queue[logging.LogRecord] = queue.Queue(-1)
+    logger.addHandler(logging.handlers.QueueHandler(log_queue))
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+    listener = logging.handlers.QueueListener(
+        log_queue,
+        *stream_handlers(sys.stdout, sys.stderr),
+        respect_handler_level=True,
+    )
+    listener.start()
+    return listener
+
+
+def capture_logger(stdout: TextIO, stderr: TextIO) -> logging.Logger:
+    # Not registered with logging.getLogger, so each --server request's logger is freed with it.
+    log = logging.Logger(f"{logger.name}.client", logging.INFO)
+    for handler in stream_handlers(stdout, stderr):
+        log.addHandler(handler)
+    return log
+
+
 def parse_args() -> argparse.Namespace:
     parser = argparse.ArgumentParser(
         description="Run a scripted web flow using Playwright and capture screenshots.",
     )
     parser.add_argument(
         "--spec",
-        required=True,
-        help="Path to JSON spec describing the flow",
+        action="append",
+        help="Path to JSON spec describing the flow (repeat to run several flows)",
     )
     parser.add_argument(
         "--out-dir",
@@ -65,12 +267,41 @@ def parse_args() -> argparse.Namespace:
         default=None,
         help="Slow down Playwright actions by N ms",
     )
-    return parser.parse_args()
+    parser.add_argument(
+        "--parallel",
+        type=int,
+        default=1,
+        help="Run up to N specs concurrently in one browser (default: 1)",
+    )
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument(
+        "--server",
+        metavar="SOCKET",
+        default=None,
+        help="Keep one browser running and accept specs on this UNIX socket",
+    )
+    mode.add_argument(
+        "--client",
+        metavar="SOCKET",
+        default=None,
+        help="Send specs to a browser started with --server on this UNIX socket",
+    )
+    args = parser.parse_args()
+    if args.server is None and not args.spec:
+        parser.error("--spec is required unless running with --server")
+    return args
+
+
+def parse_json(data: bytes) -> Any:
+    # orjson.JSONDecodeError subclasses json.JSONDecodeError, so callers catch one type.
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
 
 
 def load_spec(path: Path) -> dict[str, Any]:
     try:
-        raw = json.loads(path.read_text())
+        raw = parse_json(path.read_bytes())
     except json.JSONDecodeError as exc:
         raise SpecError(f"invalid JSON spec: {exc}") from exc
     if not isinstance(raw, dict):
@@ -92,187 +323,852 @@ def resolve_path(path: str, base_dir: Path) -> Path:
     return out
 
 
-def click_by_text(page, text: str, timeout_ms: int) -> None:
-    locator = page.get_by_role("button", name=text)
-    if locator.count() > 0:
-        locator.first.click(timeout=timeout_ms)
-        return
-    locator = page.get_by_role("link", name=text)
-    if locator.count() > 0:
-        locator.first.click(timeout=timeout_ms)
-        return
-    locator = page.get_by_text(text)
-    if locator.count() > 0:
-        locator.first.click(timeout=timeout_ms)
-        return
-    raise PlaywrightTimeoutError(f"No element found matching text: {text}")
+def resolve_base_dir(spec_path: Path, args: argparse.Namespace) -> Path:
+    return Path(args.out_dir).expanduser().resolve() if args.out_dir else spec_path.parent
 
 
-def maybe_wait(page, ms: int | None) -> None:
-    if ms is None:
-        return
-    if ms <= 0:
-        return
-    page.wait_for_timeout(ms)
+def glob_to_regex(glob: str) -> str:
+    # Mirrors Playwright's URL glob dialect minus {a,b} groups: "?" stays a literal.
+    parts: list[str] = []
+    i = 0
+    while i < len(glob):
+        if glob.startswith("**", i):
+            parts.append(".*")
+            i += 2
+        elif glob[i] == "*":
+            parts.append("[^/]*")
+            i += 1
+        else:
+            parts.append(re.escape(glob[i]))
+            i += 1
+    return "".join(parts)
 
 
-def run() -> int:
-    args = parse_args()
-    spec_path = Path(args.spec).expanduser().resolve()
-    if not spec_path.exists():
-        print(f"spec not found: {spec_path}", file=sys.stderr)
-        return 2
+def parse_block_rules(spec: dict[str, Any]) -> tuple[frozenset[str], re.Pattern[str] | None]:
+    resource_types: set[str] = set()
+    url_globs: list[str] = []
 
-    try:
-        spec = load_spec(spec_path)
-        url = require_key(spec, "url", str)
-        steps = require_key(spec, "steps", list)
-    except SpecError as exc:
-        print(f"error: {exc}", file=sys.stderr)
-        return 2
+    block_resources = spec.get("blockResources", [])
+    if not isinstance(block_resources, list):
+        raise SpecError("spec.blockResources must be a list")
+    for resource in block_resources:
+        if resource == "analytics":
+            url_globs.extend(ANALYTICS_URL_GLOBS)
+        elif resource in RESOURCE_TYPES:
+            resource_types.add(resource)
+        else:
+            raise SpecError(f"spec.blockResources has unknown resource type: {resource}")
+
+    block_urls = spec.get("blockUrls", [])
+    if not isinstance(block_urls, list) or not all(isinstance(glob, str) for glob in block_urls):
+        raise SpecError("spec.blockUrls must be a list of strings")
+    url_globs.extend(block_urls)
+
+    # One alternation is matched per request instead of looping over every glob.
+    pattern = None
+    if url_globs:
+        pattern = re.compile("|".join(f"(?:{glob_to_regex(glob)})" for glob in url_globs))
+    return frozenset(resource_types), pattern
 
-    viewport = spec.get("viewport", {"width": 1440, "height": 900})
+
+def parse_viewport(viewport: Any, label: str) -> tuple[int, int]:
     if not isinstance(viewport, dict):
-        print("error: spec.viewport must be an object", file=sys.stderr)
-        return 2
+        raise SpecError(f"{label} must be an object")
     width = viewport.get("width", 1440)
     height = viewport.get("height", 900)
     if not isinstance(width, int) or not isinstance(height, int):
-        print("error: spec.viewport width/height must be integers", file=sys.stderr)
-        return 2
+        raise SpecError(f"{label} width/height must be integers")
+    return width, height
+
+
+def parse_image_format(spec: dict[str, Any]) -> tuple[str | None, int]:
+    image_format = spec.get("format")
+    if image_format == "jpg":
+        image_format = "jpeg"
+    if image_format == "webp":
+        raise SpecError("spec.format webp is not supported by Playwright screenshots; use jpeg")
+    if image_format is not None and image_format not in IMAGE_SUFFIXES:
+        raise SpecError("spec.format must be png or jpeg")
+    quality = spec.get("quality", 85)
+    if not isinstance(quality, int) or not (0 <= quality <= 100):
+        raise SpecError("spec.quality must be an integer between 0 and 100")
+    return image_format, quality
+
+
+def parse_flow(spec: dict[str, Any], spec_path: Path, base_dir: Path) -> FlowConfig:
+    url = require_key(spec, "url", str)
+    image_format, default_quality = parse_image_format(spec)
+    steps = compile_steps(
+        require_key(spec, "steps", list),
+        image_format=image_format,
+        default_quality=default_quality,
+    )
+
+    raw_viewports = spec.get("viewports")
+    if raw_viewports is None:
+        viewport = spec.get("viewport", {"width": 1440, "height": 900})
+        viewports = [parse_viewport(viewport, "spec.viewport")]
+    elif isinstance(raw_viewports, list) and raw_viewports:
+        viewports = [parse_viewport(viewport, "spec.viewports[]") for viewport in raw_viewports]
+    else:
+        raise SpecError("spec.viewports must be a non-empty list")
 
     timeout_ms = spec.get("timeoutMs", 30000)
     if not isinstance(timeout_ms, int):
-        print("error: spec.timeoutMs must be an integer", file=sys.stderr)
-        return 2
+        raise SpecError("spec.timeoutMs must be an integer")
 
     full_page = bool(spec.get("fullPage", False))
     headless = bool(spec.get("headless", True))
-    wait_until = spec.get("waitUntil", "networkidle")
-    if wait_until not in ("load", "domcontentloaded", "networkidle", "commit"):
-        print("error: spec.waitUntil must be load|domcontentloaded|networkidle|commit", file=sys.stderr)
-        return 2
+    wait_until = spec.get("waitUntil", "domcontentloaded")
+    if wait_until not in WAIT_UNTIL_STATES:
+        raise SpecError("spec.waitUntil must be load|domcontentloaded|networkidle|commit")
     slow_mo = spec.get("slowMoMs")
-    if args.slowmo is not None:
-        slow_mo = args.slowmo
+    if slow_mo is not None and not isinstance(slow_mo, int):
+        raise SpecError("spec.slowMoMs must be an integer")
+
+    storage_state_path: Path | None = None
+    raw_storage_state_path = spec.get("storageStatePath")
+    if raw_storage_state_path is not None:
+        if not isinstance(raw_storage_state_path, str):
+            raise SpecError("spec.storageStatePath must be a string")
+        storage_state_path = resolve_path(raw_storage_state_path, spec_path.parent)
+    blocked_resource_types, blocked_url_pattern = parse_block_rules(spec)
+
+    flow = FlowConfig(
+        spec_path=spec_path,
+        url=url,
+        steps=steps,
+        viewports=viewports,
+        viewport_suffix=raw_viewports is not None,
+        timeout_ms=timeout_ms,
+        full_page=full_page,
+        headless=headless,
+        wait_until=wait_until,
+        slow_mo=slow_mo,
+        base_dir=base_dir,
+        storage_state_path=storage_state_path,
+        blocked_resource_types=blocked_resource_types,
+        blocked_url_pattern=blocked_url_pattern,
+    )
+    preflight_flow(flow)
+    return flow
+
+
+def check_url(url: str, label: str) -> None:
+    try:
+        parts = urllib.parse.urlsplit(url)
+        hostname = parts.hostname
+    except ValueError as exc:
+        raise SpecError(f"{label} is not a valid URL: {url}") from exc
+    if not parts.scheme:
+        raise SpecError(f"{label} must be an absolute URL: {url}")
+    if parts.scheme in ("http", "https") and not hostname:
+        raise SpecError(f"{label} has no host: {url}")
+
+
+def check_writable_dir(path: Path, label: str, checked: set[Path]) -> None:
+    # Directories are created on demand, so check the closest ancestor that already exists.
+    existing = path
+    while not existing.exists() and existing != existing.parent:
+        existing = existing.parent
+    if existing in checked:
+        return
+    if not existing.is_dir() or not os.access(existing, os.W_OK):
+        raise SpecError(f"{label} directory is not writable: {path}")
+    checked.add(existing)
 
+
+def preflight_flow(flow: FlowConfig) -> None:
+    """Reject specs that would fail mid-flow, before any browser is launched."""
+    checked_dirs: set[Path] = set()
+    check_url(flow.url, "spec.url")
+    if flow.storage_state_path is not None:
+        check_writable_dir(flow.storage_state_path.parent, "storageStatePath", checked_dirs)
+    for step in flow.steps:
+        match step:
+            case GotoStep(url=url):
+                check_url(url, "goto url")
+            case ScreenshotStep(path=path):
+                out_path = resolve_path(path, flow.base_dir)
+                check_writable_dir(out_path.parent, "screenshot", checked_dirs)
+            case SaveStorageStep(path=None):
+                if flow.storage_state_path is None:
+                    raise SpecError("saveStorage requires path or spec.storageStatePath")
+            case SaveStorageStep(path=str(path)):
+                check_writable_dir(
+                    resolve_path(path, flow.spec_path.parent).parent, "saveStorage", checked_dirs
+                )
+
+
+def build_flow(spec_path: Path, args: argparse.Namespace) -> FlowConfig:
+    if not spec_path.exists():
+        raise SpecError(f"spec not found: {spec_path}")
+    flow = parse_flow(load_spec(spec_path), spec_path, resolve_base_dir(spec_path, args))
+    if args.slowmo is not None:
+        flow.slow_mo = args.slowmo
     if args.headed:
-        headless = False
+        flow.headless = False
+    return flow
+
+
+def text_locator_getters(text: str) -> tuple[LocatorGetter, ...]:
+    return (
+        lambda page: page.get_by_role("button", name=text),
+        lambda page: page.get_by_role("link", name=text),
+        lambda page: page.get_by_text(text, exact=True),
+    )
+
+
+async def click_by_text(
+    page: Page,
+    getters: tuple[LocatorGetter, ...],
+    timeout_ms: int,
+    no_wait: bool = False,
+) -> None:
+    # A single union locator is resolved browser-side, instead of one count() round-trip per getter.
+    locator = getters[0](page)
+    for getter in getters[1:]:
+        locator = locator.or_(getter(page))
+    await locator.first.click(timeout=timeout_ms, no_wait_after=no_wait)
+
+
+async def maybe_wait(page: Page, ms: int | None) -> None:
+    if ms is None:
+        return
+    if ms <= 0:
+        return
+    await page.wait_for_timeout(ms)
+
+
+@dataclass(slots=True)
+class AfterWait:
+    function: str | None = None
+    selector: str | None = None
+    state: str = "visible"
+    load_state: str | None = None
+    ms: int | None = None
+
+    async def run(self, page: Page, ctx: StepContext) -> None:
+        timeout_ms = ctx.flow.timeout_ms
+        if self.function is not None:
+            await page.wait_for_function(self.function, timeout=timeout_ms)
+        elif self.selector is not None:
+            await page.locator(self.selector).first.wait_for(state=self.state, timeout=timeout_ms)
+        elif self.load_state is not None:
+            await page.wait_for_load_state(self.load_state, timeout=timeout_ms)
+        else:
+            await maybe_wait(page, self.ms)
+
+
+async def after_wait(page: Page, after: AfterWait | None, ctx: StepContext) -> None:
+    if after is not None:
+        await after.run(page, ctx)
+
+
+@dataclass(slots=True)
+class WaitForStep:
+    selector: str
+    after: AfterWait | None = None
+
+    async def run(self, page: Page, ctx: StepContext) -> None:
+        await page.wait_for_selector(self.selector, timeout=ctx.flow.timeout_ms)
+        await after_wait(page, self.after, ctx)
+
 
-    base_dir = Path(args.out_dir).expanduser().resolve() if args.out_dir else spec_path.parent
+@dataclass(slots=True)
+class ClickStep:
+    selector: str
+    no_wait_after: bool = False
+    after: AfterWait | None = None
 
+    async def run(self, page: Page, ctx: StepContext) -> None:
+        await page.click(self.selector, timeout=ctx.flow.timeout_ms, no_wait_after=self.no_wait_after)
+        await after_wait(page, self.after, ctx)
+
+
+@dataclass(slots=True)
+class ClickTextStep:
+    text: str
+    getters: tuple[LocatorGetter, ...]
+    no_wait_after: bool = False
+    after: AfterWait | None = None
+
+    async def run(self, page: Page, ctx: StepContext) -> None:
+        await click_by_text(page, self.getters, ctx.flow.timeout_ms, no_wait=self.no_wait_after)
+        await after_wait(page, self.after, ctx)
+
+
+@dataclass(slots=True)
+class FillStep:
+    selector: str
+    value: str
+    after: AfterWait | None = None
+
+    async def run(self, page: Page, ctx: StepContext) -> None:
+        await page.fill(self.selector, self.value, timeout=ctx.flow.timeout_ms)
+        await after_wait(page, self.after, ctx)
+
+
+@dataclass(slots=True)
+class SleepStep:
+    ms: int
+
+    async def run(self, page: Page, ctx: StepContext) -> None:
+        await page.wait_for_timeout(self.ms)
+
+
+@dataclass(slots=True)
+class ScreenshotStep:
+    path: str
+    quality: int | None = None
+    image_type: str | None = None
+    after: AfterWait | None = None
+
+    async def run(self, page: Page, ctx: StepContext) -> None:
+        await after_wait(page, self.after, ctx)
+        out_path = ctx.screenshot_path(self.path)
+        screenshot_args: dict[str, Any] = {"full_page": ctx.flow.full_page}
+        if self.quality is not None:
+            screenshot_args["quality"] = self.quality
+        if self.image_type is not None:
+            screenshot_args["type"] = self.image_type
+        # Encoding happens in the browser; the disk write is queued so the next step can start.
+        data = await page.screenshot(**screenshot_args)
+        ctx.writer.put(out_path, data)
+
+
+def write_private_file(path: Path, data: bytes) -> None:
+    # Storage state holds session cookies: write it owner-only and swap it in atomically.
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp_name = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as handle:
+            os.fchmod(handle.fileno(), 0o600)
+            handle.write(data)
+            handle.flush()
+            os.fsync(handle.fileno())
+        os.replace(tmp_name, path)
+    except BaseException:
+        Path(tmp_name).unlink(missing_ok=True)
+        raise
+
+
+async def save_storage_state(
+    context: BrowserContext, path: Path, locks: dict[Path, asyncio.Lock]
+) -> None:
+    async with locks.setdefault(path, asyncio.Lock()):
+        state = await context.storage_state()
+        data = json.dumps(state, indent=2).encode("utf-8")
+        await asyncio.to_thread(write_private_file, path, data)
+
+
+@dataclass(slots=True)
+class SaveStorageStep:
+    path: str | None = None
+
+    async def run(self, page: Page, ctx: StepContext) -> None:
+        if self.path is None:
+            path = ctx.flow.storage_state_path
+        else:
+            path = resolve_path(self.path, ctx.flow.spec_path.parent)
+        await save_storage_state(page.context, path, ctx.flow.storage_locks)
+        ctx.flow.log.info("Saved storage state: %s", path)
+
+
+@dataclass(slots=True)
+class GotoStep:
+    url: str
+    wait_until: str | None = None
+    after: AfterWait | None = None
+
+    async def run(self, page: Page, ctx: StepContext) -> None:
+        wait_until = self.wait_until or ctx.flow.wait_until
+        await page.goto(self.url, wait_until=wait_until, timeout=ctx.flow.timeout_ms)
+        await after_wait(page, self.after, ctx)
+
+
+Step = (
+    WaitForStep
+    | ClickStep
+    | ClickTextStep
+    | FillStep
+    | SleepStep
+    | ScreenshotStep
+    | SaveStorageStep
+    | GotoStep
+)
+
+
+def step_str(raw_step: dict[str, Any], action: str, key: str) -> str:
+    value = raw_step.get(key)
+    if not isinstance(value, str):
+        raise SpecError(f"{action} requires {key}")
+    return value
+
+
+def compile_after_wait(raw_step: dict[str, Any]) -> AfterWait | None:
+    spec_wait = raw_step.get("afterWait")
+    if spec_wait is None:
+        after_ms = raw_step.get("afterMs")
+        if after_ms is None:
+            return None
+        if not isinstance(after_ms, int):
+            raise SpecError("afterMs must be an integer")
+        return AfterWait(ms=after_ms)
+    if not isinstance(spec_wait, dict):
+        raise SpecError("afterWait must be an object")
+
+    function = spec_wait.get("function")
+    if function is not None:
+        if not isinstance(function, str):
+            raise SpecError("afterWait.function must be a string")
+        return AfterWait(function=function)
+
+    selector = spec_wait.get("selector")
+    if selector is not None:
+        if not isinstance(selector, str):
+            raise SpecError("afterWait.selector must be a string")
+        state = spec_wait.get("state", "visible")
+        if state not in ("attached", "detached", "visible", "hidden"):
+            raise SpecError("afterWait.state must be attached|detached|visible|hidden")
+        return AfterWait(selector=selector, state=state)
+
+    load_state = spec_wait.get("loadState")
+    if load_state is not None:
+        if load_state not in ("load", "domcontentloaded", "networkidle"):
+            raise SpecError("afterWait.loadState must be load|domcontentloaded|networkidle")
+        return AfterWait(load_state=load_state)
+
+    raise SpecError("afterWait requires selector, function, or loadState")
+
+
+def compile_screenshot(
+    raw_step: dict[str, Any],
+    image_format: str | None,
+    default_quality: int,
+) -> ScreenshotStep:
+    path = step_str(raw_step, "screenshot", "path")
+    quality = raw_step.get("quality", raw_step.get("jpegQuality"))
+    if quality is not None:
+        if not isinstance(quality, int) or not (0 <= quality <= 100):
+            raise SpecError("screenshot quality must be an integer between 0 and 100")
+    image_type = raw_step.get("type")
+    suffix = Path(path).suffix.lower()
+    if image_type is not None:
+        if image_type not in ("png", "jpeg"):
+            raise SpecError("screenshot type must be png or jpeg")
+    elif image_format is not None:
+        image_type = image_format
+        if suffix in {"", ".png", ".jpg", ".jpeg", ".webp"}:
+            path = str(Path(path).with_suffix(IMAGE_SUFFIXES[image_format]))
+    elif suffix in {".jpg", ".jpeg"}:
+        image_type = "jpeg"
+
+    if image_type == "jpeg":
+        if quality is None:
+            quality = default_quality
+    elif quality is not None:
+        raise SpecError("screenshot quality only applies to jpeg screenshots")
+    return ScreenshotStep(
+        path=path,
+        quality=quality,
+        image_type=image_type,
+        after=compile_after_wait(raw_step),
+    )
+
+
+def compile_steps(
+    raw_steps: list[Any],
+    image_format: str | None = None,
+    default_quality: int = 85,
+) -> list[Step]:
+    """Validate raw spec steps into typed steps so running a flow does no spec checks."""
+    getters_by_text: dict[str, tuple[LocatorGetter, ...]] = {}
+    compiled: list[Step] = []
+    for raw_step in raw_steps:
+        if not isinstance(raw_step, dict):
+            raise SpecError("each step must be an object")
+        action = raw_step.get("action")
+        if not isinstance(action, str):
+            raise SpecError("step.action must be a string")
+
+        step: Step
+        match action:
+            case "waitFor":
+                step = WaitForStep(
+                    selector=step_str(raw_step, action, "selector"),
+                    after=compile_after_wait(raw_step),
+                )
+            case "click":
+                step = ClickStep(
+                    selector=step_str(raw_step, action, "selector"),
+                    no_wait_after=bool(raw_step.get("noWaitAfter", False)),
+                    after=compile_after_wait(raw_step),
+                )
+            case "clickText":
+                text = step_str(raw_step, action, "text")
+                if text not in getters_by_text:
+                    getters_by_text[text] = text_locator_getters(text)
+                step = ClickTextStep(
+                    text=text,
+                    getters=getters_by_text[text],
+                    no_wait_after=bool(raw_step.get("noWaitAfter", False)),
+                    after=compile_after_wait(raw_step),
+                )
+            case "fill":
+                step = FillStep(
+                    selector=step_str(raw_step, action, "selector"),
+                    value=step_str(raw_step, action, "value"),
+                    after=compile_after_wait(raw_step),
+                )
+            case "sleep":
+                sleep_ms = raw_step.get("ms")
+                if not isinstance(sleep_ms, int):
+                    raise SpecError("sleep requires ms")
+                step = SleepStep(ms=sleep_ms)
+            case "screenshot":
+                step = compile_screenshot(raw_step, image_format, default_quality)
+            case "saveStorage":
+                path = raw_step.get("path")
+                if path is not None and not isinstance(path, str):
+                    raise SpecError("saveStorage path must be a string")
+                step = SaveStorageStep(path=path)
+            case "goto":
+                wait_until = raw_step.get("waitUntil")
+                if wait_until is not None and wait_until not in WAIT_UNTIL_STATES:
+                    raise SpecError("goto waitUntil must be load|domcontentloaded|networkidle|commit")
+                step = GotoStep(
+                    url=step_str(raw_step, action, "url"),
+                    wait_until=wait_until,
+                    after=compile_after_wait(raw_step),
+                )
+            case _:
+                raise SpecError(f"unknown action: {action}")
+        compiled.append(step)
+    return fuse_wait_for_click(compiled)
+
+
+def fuse_wait_for_click(steps: list[Step]) -> list[Step]:
+    # page.click() already waits for the element to be actionable, so a bare waitFor
+    # on the same selector right before it only costs an extra round-trip.
+    fused: list[Step] = []
+    for index, step in enumerate(steps):
+        next_step = steps[index + 1] if index + 1 < len(steps) else None
+        if (
+            isinstance(step, WaitForStep)
+            and step.after is None
+            and isinstance(next_step, ClickStep)
+            and next_step.selector == step.selector
+        ):
+            continue
+        fused.append(step)
+    return fused
+
+
+async def install_block_rules(context: BrowserContext, flow: FlowConfig) -> None:
+    resource_types = flow.blocked_resource_types
+    url_pattern = flow.blocked_url_pattern
+    if not resource_types and url_pattern is None:
+        return
+
+    async def handle_route(route: Route) -> None:
+        request = route.request
+        if request.resource_type in resource_types or (
+            url_pattern is not None and url_pattern.fullmatch(request.url)
+        ):
+            await route.abort()
+        else:
+            await route.continue_()
+
+    await context.route("**/*", handle_route)
+
+
+async def run_viewport(browser: Browser, flow: FlowConfig, width: int, height: int) -> None:
+    context_args: dict[str, Any] = {"viewport": {"width": width, "height": height}}
+    if flow.storage_state_path is not None and flow.storage_state_path.exists():
+        context_args["storage_state"] = str(flow.storage_state_path)
+    context = await browser.new_context(**context_args)
+    await install_block_rules(context, flow)
+    writer = ScreenshotWriter(flow.log)
+    writer.start()
+    ctx = StepContext(
+        flow=flow,
+        writer=writer,
+        viewport_suffix=f"@{width}x{height}" if flow.viewport_suffix else "",
+    )
     try:
-        with sync_playwright() as p:
-            browser = p.chromium.launch(headless=headless, slow_mo=slow_mo)
-            context = browser.new_context(viewport={"width": width, "height": height})
-            page = context.new_page()
-            page.goto(url, wait_until=wait_until, timeout=timeout_ms)
-
-            for raw_step in steps:
-                if not isinstance(raw_step, dict):
-                    raise SpecError("each step must be an object")
-                action = raw_step.get("action")
-                if not isinstance(action, str):
-                    raise SpecError("step.action must be a string")
-
-                if action == "waitFor":
-                    selector = raw_step.get("selector")
-                    if not isinstance(selector, str):
-                        raise SpecError("waitFor requires selector")
-                    page.wait_for_selector(selector, timeout=timeout_ms)
-                    maybe_wait(page, raw_step.get("afterMs"))
-                elif action == "click":
-                    selector = raw_step.get("selector")
-                    if not isinstance(selector, str):
-                        raise SpecError("click requires selector")
-                    no_wait = bool(raw_step.get("noWaitAfter", False))
-                    page.click(selector, timeout=timeout_ms, no_wait_after=no_wait)
-                    maybe_wait(page, raw_step.get("afterMs"))
-                elif action == "clickText":
-                    text = raw_step.get("text")
-                    if not isinstance(text, str):
-                        raise SpecError("clickText requires text")
-                    no_wait = bool(raw_step.get("noWaitAfter", False))
-                    if no_wait:
-                        locator = page.get_by_role("button", name=text)
-                        if locator.count() > 0:
-                            locator.first.click(timeout=timeout_ms, no_wait_after=True)
-                        else:
-                            locator = page.get_by_role("link", name=text)
-                            if locator.count() > 0:
-                                locator.first.click(timeout=timeout_ms, no_wait_after=True)
-                            else:
-                                locator = page.get_by_text(text)
-                                if locator.count() > 0:
-                                    locator.first.click(timeout=timeout_ms, no_wait_after=True)
-                                else:
-                                    raise PlaywrightTimeoutError(
-                                        f"No element found matching text: {text}"
-                                    )
-                    else:
-                        click_by_text(page, text, timeout_ms)
-                    maybe_wait(page, raw_step.get("afterMs"))
-                elif action == "fill":
-                    selector = raw_step.get("selector")
-                    value = raw_step.get("value")
-                    if not isinstance(selector, str):
-                        raise SpecError("fill requires selector")
-                    if not isinstance(value, str):
-                        raise SpecError("fill requires value")
-                    page.fill(selector, value, timeout=timeout_ms)
-                    maybe_wait(page, raw_step.get("afterMs"))
-                elif action == "sleep":
-                    sleep_ms = raw_step.get("ms")
-                    if not isinstance(sleep_ms, int):
-                        raise SpecError("sleep requires ms")
-                    page.wait_for_timeout(sleep_ms)
-                elif action == "screenshot":
-                    path = raw_step.get("path")
-                    if not isinstance(path, str):
-                        raise SpecError("screenshot requires path")
-                    maybe_wait(page, raw_step.get("afterMs"))
-                    out_path = resolve_path(path, base_dir)
-                    out_path.parent.mkdir(parents=True, exist_ok=True)
-                    screenshot_args: dict[str, Any] = {
-                        "path": str(out_path),
-                        "full_page": full_page,
-                    }
-                    quality = raw_step.get("quality", raw_step.get("jpegQuality"))
-                    if quality is not None:
-                        if not isinstance(quality, int) or not (0 <= quality <= 100):
-                            raise SpecError("screenshot quality must be an integer between 0 and 100")
-                        screenshot_args["quality"] = quality
-                    image_type = raw_step.get("type")
-                    if image_type is not None:
-                        if image_type not in ("png", "jpeg"):
-                            raise SpecError("screenshot type must be png or jpeg")
-                        screenshot_args["type"] = image_type
-                    elif out_path.suffix.lower() in {".jpg", ".jpeg"}:
-                        screenshot_args["type"] = "jpeg"
-                    page.screenshot(**screenshot_args)
-                    print(f"Saved screenshot: {out_path}")
-                elif action == "goto":
-                    next_url = raw_step.get("url")
-                    if not isinstance(next_url, str):
-                        raise SpecError("goto requires url")
-                    page.goto(next_url, wait_until=wait_until, timeout=timeout_ms)
-                    maybe_wait(page, raw_step.get("afterMs"))
-                else:
-                    raise SpecError(f"unknown action: {action}")
-
-            context.close()
-            browser.close()
+        page = await context.new_page()
+        await page.goto(flow.url, wait_until=flow.wait_until, timeout=flow.timeout_ms)
+
+        for step in flow.steps:
+            await step.run(page, ctx)
+
+        if flow.storage_state_path is not None:
+            await save_storage_state(context, flow.storage_state_path, flow.storage_locks)
+    finally:
+        # Screenshots taken before a failing step are still flushed; they help debugging.
+        await writer.close()
+        await context.close()
+    if writer.failures:
+        raise OSError(f"failed to write {writer.failures} screenshot(s)")
+
+
+def create_screenshot_dirs(flow: FlowConfig) -> None:
+    # Created once up front so screenshot steps do not stat/mkdir on every capture.
+    out_dirs = {
+        resolve_path(step.path, flow.base_dir).parent
+        for step in flow.steps
+        if isinstance(step, ScreenshotStep)
+    }
+    for out_dir in out_dirs:
+        out_dir.mkdir(parents=True, exist_ok=True)
+
+
+async def run_flow(browser: Browser, flow: FlowConfig) -> None:
+    create_screenshot_dirs(flow)
+    if len(flow.viewports) == 1:
+        width, height = flow.viewports[0]
+        await run_viewport(browser, flow, width, height)
+        return
+    # Contexts are cheap compared with a browser launch, so every viewport runs at once.
+    results = await asyncio.gather(
+        *(run_viewport(browser, flow, width, height) for width, height in flow.viewports),
+        return_exceptions=True,
+    )
+    for result in results:
+        if isinstance(result, BaseException):
+            raise result
+
+
+async def run_flow_guarded(
+    browser: Browser,
+    flow: FlowConfig,
+    semaphore: asyncio.Semaphore,
+    label: str,
+) -> int:
+    async with semaphore:
+        try:
+            await run_flow(browser, flow)
+        except SpecError as exc:
+            flow.log.error("error: %s%s", label, exc)
+            return 2
+        except PlaywrightTimeoutError as exc:
+            flow.log.error("error: %s%s", label, exc)
+            return 2
+        except Exception as exc:  # noqa: BLE001
+            flow.log.error("error: %s%s", label, exc)
+            return 1
+    return 0
+
+
+async def run_flows(flows: list[FlowConfig], parallel: int) -> int:
+    # Browser-level options are shared, so any headed or slowed-down flow applies to all.
+    headless = all(flow.headless for flow in flows)
+    slow_mo_values = [flow.slow_mo for flow in flows if flow.slow_mo is not None]
+    slow_mo = max(slow_mo_values) if slow_mo_values else None
+    semaphore = asyncio.Semaphore(parallel)
+    storage_locks: dict[Path, asyncio.Lock] = {}
+    for flow in flows:
+        flow.storage_locks = storage_locks
+
+    async with async_playwright() as p:
+        browser = await p.chromium.launch(headless=headless, slow_mo=slow_mo)
+        try:
+            codes = await asyncio.gather(
+                *(
+                    run_flow_guarded(
+                        browser,
+                        flow,
+                        semaphore,
+                        f"{flow.spec_path}: " if len(flows) > 1 else "",
+                    )
+                    for flow in flows
+                )
+            )
+        finally:
+            await browser.close()
+    return max(codes)
+
+
+async def handle_client(
+    browser: Browser,
+    semaphore: asyncio.Semaphore,
+    storage_locks: dict[Path, asyncio.Lock],
+    reader: asyncio.StreamReader,
+    writer: asyncio.StreamWriter,
+) -> None:
+    stdout = io.StringIO()
+    stderr = io.StringIO()
+    log = capture_logger(stdout, stderr)
+    data = await reader.read()
+    if not data:
+        # Empty connections come from remove_stale_socket probing for a live server.
+        writer.close()
+        await writer.wait_closed()
+        return
+    try:
+        request = parse_json(data)
+        if not isinstance(request, dict):
+            raise SpecError("request must be a JSON object")
+        spec = request.get("spec")
+        if not isinstance(spec, dict):
+            raise SpecError("spec must be a JSON object")
+        spec_path = Path(require_key(request, "specPath", str))
+        base_dir = Path(require_key(request, "baseDir", str))
+        flow = parse_flow(spec, spec_path, base_dir)
+        flow.log = log
+        flow.storage_locks = storage_locks
+        code = await run_flow_guarded(browser, flow, semaphore, "")
+    except json.JSONDecodeError as exc:
+        log.error("error: invalid JSON request: %s", exc)
+        code = 2
     except SpecError as exc:
-        print(f"error: {exc}", file=sys.stderr)
-        return 2
-    except PlaywrightTimeoutError as exc:
-        print(f"error: {exc}", file=sys.stderr)
-        return 2
+        log.error("error: %s", exc)
+        code = 2
     except Exception as exc:  # noqa: BLE001
-        print(f"error: {exc}", file=sys.stderr)
+        # Always answer; a dropped connection leaves the client with nothing to report.
+        log.error("error: %s", exc)
+        code = 1
+
+    response = {"stdout": stdout.getvalue(), "stderr": stderr.getvalue(), "exitCode": code}
+    try:
+        writer.write(json.dumps(response).encode("utf-8"))
+        await writer.drain()
+        writer.close()
+        await writer.wait_closed()
+    except ConnectionError as exc:
+        logger.warning("warning: client disconnected before the response: %s", exc)
+
+
+def remove_stale_socket(sock_path: Path) -> None:
+    # A socket left behind by a crashed server blocks bind. Only remove it if it really is a
+    # socket and nothing is listening on it; never touch regular files or a live server.
+    try:
+        mode = sock_path.lstat().st_mode
+    except FileNotFoundError:
+        return
+    if not stat.S_ISSOCK(mode):
+        raise SpecError(f"{sock_path} exists and is not a socket")
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as probe:
+        try:
+            probe.connect(os.fspath(sock_path))
+        except ConnectionRefusedError:
+            sock_path.unlink()
+            return
+    raise SpecError(f"a server is already listening on {sock_path}")
+
+
+async def serve(sock_path: Path, args: argparse.Namespace) -> None:
+    semaphore = asyncio.Semaphore(args.parallel)
+    storage_locks: dict[Path, asyncio.Lock] = {}
+
+    async with async_playwright() as p:
+        browser = await p.chromium.launch(headless=not args.headed, slow_mo=args.slowmo)
+        try:
+            server = await asyncio.start_unix_server(
+                lambda reader, writer: handle_client(
+                    browser, semaphore, storage_locks, reader, writer
+                ),
+                path=str(sock_path),
+            )
+            logger.info("Serving browser on %s", sock_path)
+            async with server:
+                await server.serve_forever()
+        finally:
+            await browser.close()
+            if sock_path.is_socket():
+                sock_path.unlink()
+
+
+def send_spec(sock_path: Path, spec_path: Path, args: argparse.Namespace) -> int:
+    if not spec_path.exists():
+        raise SpecError(f"spec not found: {spec_path}")
+    request = {
+        "spec": load_spec(spec_path),
+        "specPath": str(spec_path),
+        "baseDir": str(resolve_base_dir(spec_path, args)),
+    }
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.connect(os.fspath(sock_path))
+        sock.sendall(json.dumps(request).encode("utf-8"))
+        sock.shutdown(socket.SHUT_WR)
+        chunks: list[bytes] = []
+        while chunk := sock.recv(65536):
+            chunks.append(chunk)
+    try:
+        response = parse_json(b"".join(chunks))
+        stdout = str(response["stdout"])
+        stderr = str(response["stderr"])
+        code = int(response["exitCode"])
+    except (ValueError, KeyError, TypeError):
+        logger.error("error: bad response from server at %s", sock_path)
         return 1
+    if stdout:
+        logger.info("%s", stdout.rstrip("\n"))
+    if stderr:
+        logger.error("%s", stderr.rstrip("\n"))
+    return code
 
-    return 0
+
+def run() -> int:
+    args = parse_args()
+    listener = start_log_listener()
+    try:
+        return run_mode(args)
+    finally:
+        listener.stop()
+
+
+def run_mode(args: argparse.Namespace) -> int:
+    if args.parallel < 1:
+        logger.error("error: --parallel must be at least 1")
+        return 2
+
+    if args.server is not None:
+        sock_path = Path(args.server).expanduser().resolve()
+        try:
+            remove_stale_socket(sock_path)
+        except SpecError as exc:
+            logger.error("error: %s", exc)
+            return 2
+        try:
+            asyncio.run(serve(sock_path, args))
+        except KeyboardInterrupt:
+            pass
+        except Exception as exc:  # noqa: BLE001
+            logger.error("error: %s", exc)
+            return 1
+        return 0
+
+    if args.client is not None:
+        sock_path = Path(args.client).expanduser().resolve()
+        codes: list[int] = []
+        for raw_path in args.spec:
+            spec_path = Path(raw_path).expanduser().resolve()
+            try:
+                codes.append(send_spec(sock_path, spec_path, args))
+            except SpecError as exc:
+                logger.error("error: %s", exc)
+                return 2
+            except OSError as exc:
+                logger.error("error: cannot reach server at %s: %s", sock_path, exc)
+                return 1
+        return max(codes)
+
+    flows: list[FlowConfig] = []
+    for raw_path in args.spec:
+        spec_path = Path(raw_path).expanduser().resolve()
+        try:
+            flows.append(build_flow(spec_path, args))
+        except SpecError as exc:
+            logger.error("error: %s", exc)
+            return 2
+
+    try:
+        return asyncio.run(run_flows(flows, args.parallel))
+    except Exception as exc:  # noqa: BLE001
+        logger.error("error: %s", exc)
+        return 1
 
 
 if __name__ == "__main__":
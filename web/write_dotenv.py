@@ -1,5 +1,8 @@
+import argparse
 import os
 import sys
+import tempfile
+from pathlib import Path
 
 
 def parse_env_entries(content: str) -> list[tuple[str, str]]:
@@ -23,10 +26,34 @@ def parse_env_entries(content: str) -> list[tuple[str, str]]:
     return entries
 
 
-def write_text_file(path: str, content: str) -> None:
-    os.makedirs(os.path.dirname(path), exist_ok=True)
-    with open(path, "w", encoding="utf-8") as file:
-        file.write(content)
+def write_text_file(path: str, content: str) -> bool:
+    """Atomically replace `path` with `content`; returns False if it already matched."""
+    out = Path(path)
+    data = content.encode("utf-8")
+    try:
+        if out.read_bytes() == data:
+            return False
+    except FileNotFoundError:
+        pass
+    out.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp_name = tempfile.mkstemp(dir=out.parent, prefix=f".{out.name}.", suffix=".tmp")
+    tmp = Path(tmp_name)
+    try:
+        try:
+            os.fchmod(fd, 0o600)
+            view = memoryview(data)
+            while view:
+                written = os.write(fd, view)
+                view = view[written:]
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+        os.replace(tmp, out)
+    except BaseException:
+        # The temp file holds the secret; never leave it behind.
+        tmp.unlink(missing_ok=True)
+        raise
+    return True
 
 
 def render_cloud_run_env_yaml(entries: list[tuple[str, str]]) -> str:
@@ -37,26 +64,76 @@ def render_cloud_run_env_yaml(entries: list[tuple[str, str]]) -> str:
     return "\n".join(lines) + "\n"
 
 
-dotenv = os.getenv("DOTENV")
-if dotenv is None:
-    print(
-        "ERROR: DOTENV environment variable is not set. Did Secret Manager mount it?",
-        file=sys.stderr,
+def parse_args(argv: list[str]) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Write the DOTENV secret to a dotenv file and a Cloud Run env YAML.",
     )
-    sys.exit(1)
-
-entries = parse_env_entries(dotenv)
-
-dotenv_file_name = "web/.env.local"
-cloud_run_env_file_name = "web/cloud-run-env.yaml"
-
-print(f"Writing {dotenv_file_name} (len={len(dotenv)})")
-for key, value in entries:
-    print(f"ENV {key} len={len(value)}")
-write_text_file(dotenv_file_name, dotenv)
-cloud_run_env_yaml = render_cloud_run_env_yaml(entries)
-print(
-    f"Writing {cloud_run_env_file_name} (entries={len(entries)})"
-)
-write_text_file(cloud_run_env_file_name, cloud_run_env_yaml)
-print("Done.")
+    parser.add_argument(
+        "--out",
+        default="web/.env.local",
+        help="Dotenv output path (default: web/.env.local)",
+    )
+    cloud_run_env = parser.add_mutually_exclusive_group()
+    cloud_run_env.add_argument(
+        "--cloud-run-env-out",
+        default="web/cloud-run-env.yaml",
+        help="Cloud Run --env-vars-file YAML output path (default: web/cloud-run-env.yaml)",
+    )
+    cloud_run_env.add_argument(
+        "--no-cloud-run-env",
+        dest="cloud_run_env_out",
+        action="store_const",
+        const=None,
+        help="Skip writing the Cloud Run env YAML",
+    )
+    requirement = parser.add_mutually_exclusive_group()
+    requirement.add_argument(
+        "--required",
+        dest="required",
+        action="store_true",
+        default=True,
+        help="Fail when DOTENV is not set (default)",
+    )
+    requirement.add_argument(
+        "--optional",
+        dest="required",
+        action="store_false",
+        help="Skip writing and exit successfully when DOTENV is not set",
+    )
+    return parser.parse_args(argv)
+
+
+def main(argv: list[str]) -> int:
+    args = parse_args(argv)
+
+    dotenv = os.getenv("DOTENV")
+    if dotenv is None:
+        if not args.required:
+            print("DOTENV environment variable is not set; skipping.")
+            return 0
+        print(
+            "ERROR: DOTENV environment variable is not set. Did Secret Manager mount it?",
+            file=sys.stderr,
+        )
+        return 1
+
+    entries = parse_env_entries(dotenv)
+
+    print(f"Writing {args.out} (len={len(dotenv)})")
+    for key, value in entries:
+        print(f"ENV {key} len={len(value)}")
+    if not write_text_file(args.out, dotenv):
+        print(f"{args.out} is unchanged")
+    if args.cloud_run_env_out is not None:
+        cloud_run_env_yaml = render_cloud_run_env_yaml(entries)
+        print(
+            f"Writing {args.cloud_run_env_out} (entries={len(entries)})"
+        )
+        if not write_text_file(args.cloud_run_env_out, cloud_run_env_yaml):
+            print(f"{args.cloud_run_env_out} is unchanged")
+    print("Done.")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main(sys.argv[1:]))